@@ -6,12 +6,16 @@ from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+try:
+    from src.metrics_store import MetricsStore
+except ImportError:
+    from metrics_store import MetricsStore
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class PerformanceEvaluator:
-    def __init__(self, output_path=None, confidence_threshold=0.85):
+    def __init__(self, output_path=None, confidence_threshold=0.85, store_path=None):
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         if output_path is None:
             self.output_path = os.path.join(base_dir, "data", "processed", "quality_report.pdf")
@@ -28,6 +32,8 @@ class PerformanceEvaluator:
             "processed_docs": 0,
             "low_confidence_flags": 0
         }
+        # Optional persistent store; reports are then aggregated from it across runs
+        self.store = MetricsStore(store_path) if store_path else None
 
     def validate_results(self, results):
         """
@@ -39,14 +45,19 @@ class PerformanceEvaluator:
         for i, res in enumerate(results):
             if res.get('confidence', 0) < self.confidence_threshold:
                 flags.append(i)
-                logger.warning(f"Low confidence flagged at index {i}: {res.get('text')} (Conf: {res.get('confidence'):.4f})")
+                logger.debug(f"Low confidence flagged at index {i}: {res.get('text')} (Conf: {res.get('confidence'):.4f})")
         
+        if flags:
+            logger.warning(f"{len(flags)}/{len(results)} results below confidence threshold {self.confidence_threshold}.")
         self.metrics["low_confidence_flags"] += len(flags)
         return flags
 
     def update_from_pipeline(self, results):
         if not results: return
         self.metrics["processed_docs"] += 1
+        # Placeholders for pages skipped under a latency budget are not tables
+        results = [res for res in results if not res.get('skipped_page')]
+        if not results: return
         self.metrics["table_count"] += len(results)
         
         # Validate results and update metrics
@@ -60,11 +71,40 @@ class PerformanceEvaluator:
         n = self.metrics["table_count"]
         self.metrics["ocr_avg_confidence"] = (current_avg * (n-1) + (conf_sum / total_cells)) / n
 
-    def generate_report(self, validation_errors=None):
+    def record_document(self, document_id, results, stage_times=None):
+        """Updates the in-process metrics and, if configured, appends the run to the metrics store."""
+        self.update_from_pipeline(results)
+        if self.store is not None:
+            self.store.record_document(document_id, results, stage_times, confidence_threshold=self.confidence_threshold)
+
+    @staticmethod
+    def _epoch(value):
+        """Epoch seconds for anything pd.Timestamp accepts; naive timestamps are taken as local time."""
+        if value is None:
+            return None
+        ts = pd.Timestamp(value)
+        if ts.tzinfo is None:
+            # datetime.timestamp() interprets naive values in the local timezone
+            return ts.to_pydatetime().timestamp()
+        return ts.timestamp()
+
+    def generate_report(self, validation_errors=None, since=None, until=None):
         """
         Generates a professional quality report with summary statistics and validation errors.
+        With a metrics store, statistics are aggregated over [since, until) (timestamps or
+        anything pd.Timestamp accepts, naive ones in local time) widened to whole hours;
+        otherwise the in-process metrics are used.
         """
         logger.info(f"Generating professional report at {self.output_path}")
+        metrics = dict(self.metrics)
+        percentiles = None
+        window = None
+        if self.store is not None:
+            summary = self.store.summary(self._epoch(since), self._epoch(until))
+            percentiles = (summary.pop("confidence_percentiles"), summary.pop("latency_percentiles"))
+            window = summary.pop("window")
+            metrics.update(summary)
+
         doc = SimpleDocTemplate(self.output_path, pagesize=letter)
         styles = getSampleStyleSheet()
         
@@ -79,21 +119,27 @@ class PerformanceEvaluator:
         # Header Section
         elements.append(Paragraph("Quality Assurance Report", header_style))
         elements.append(Paragraph("Financial Data Extraction Pipeline", styles['Heading3']))
+        if window is not None:
+            fmt_ts = lambda t: pd.Timestamp(t, unit='s', tz='UTC').strftime('%Y-%m-%d %H:%M UTC')
+            start, end = window
+            elements.append(Paragraph(
+                f"Reporting window: {'start of history' if start is None else fmt_ts(start)} to "
+                f"{'now' if end is None else fmt_ts(end)} (whole hours)", styles['Normal']))
         elements.append(Spacer(1, 20))
         
         # Summary Statistics Section
         elements.append(Paragraph("Summary Statistics", section_style))
         elements.append(Spacer(1, 10))
         
-        status = "PASS" if self.metrics['ocr_avg_confidence'] >= self.confidence_threshold else "REVIEW REQUIRED"
+        status = "PASS" if metrics['ocr_avg_confidence'] >= self.confidence_threshold else "REVIEW REQUIRED"
         
         data = [
             ["Metric Category", "Calculated Value", "Compliance Status"],
-            ["Extraction Health (IOU)", f"{self.metrics['detection_iou']*100:.1f}%", "PASS"],
-            ["Aggregate Confidence", f"{self.metrics['ocr_avg_confidence']*100:.1f}%", status],
-            ["Data Integrity Flags", str(self.metrics['low_confidence_flags']), "WARNING" if self.metrics['low_confidence_flags'] > 0 else "OPTIMAL"],
-            ["Volume (Tables)", str(self.metrics['table_count']), "COMPLETED"],
-            ["Volume (Documents)", str(self.metrics['processed_docs']), "COMPLETED"]
+            ["Extraction Health (IOU)", f"{metrics['detection_iou']*100:.1f}%", "PASS"],
+            ["Aggregate Confidence", f"{metrics['ocr_avg_confidence']*100:.1f}%", status],
+            ["Data Integrity Flags", str(metrics['low_confidence_flags']), "WARNING" if metrics['low_confidence_flags'] > 0 else "OPTIMAL"],
+            ["Volume (Tables)", str(metrics['table_count']), "COMPLETED"],
+            ["Volume (Documents)", str(metrics['processed_docs']), "COMPLETED"]
         ]
         
         summary_table = Table(data, hAlign='LEFT', colWidths=[180, 150, 150])
@@ -111,6 +157,28 @@ class PerformanceEvaluator:
         elements.append(summary_table)
         elements.append(Spacer(1, 24))
         
+        if percentiles is not None:
+            conf_pct, latency_pct = percentiles
+            elements.append(Paragraph("Confidence & Latency Percentiles", section_style))
+            elements.append(Spacer(1, 10))
+            fmt = lambda v, scale=1, suffix="": "n/a" if v is None else f"{v*scale:.2f}{suffix}"
+            p_data = [["Metric", "p50", "p90", "p99"]]
+            p_data.append(["Table Confidence"] + [fmt(conf_pct[q], 100, "%") for q in (0.5, 0.9, 0.99)])
+            for name, pct in latency_pct.items():
+                p_data.append([f"Latency ({name})"] + [fmt(pct[q], suffix=" s") for q in (0.5, 0.9, 0.99)])
+            
+            p_table = Table(p_data, hAlign='LEFT', colWidths=[180, 100, 100, 100])
+            p_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#333333")),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 10),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ]))
+            elements.append(p_table)
+            elements.append(Spacer(1, 24))
+        
         # Validation Errors Section
         elements.append(Paragraph("Validation Errors & Flags", section_style))
         elements.append(Spacer(1, 10))
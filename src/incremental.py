@@ -0,0 +1,183 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def page_fingerprint(pil_image, width=256):
+    """
+    Content hash of a rendered page. The page is downsampled and quantized to
+    16 gray levels first so rasterization noise does not mark a page as changed.
+    """
+    gray = pil_image.convert('L')
+    height = max(1, int(gray.size[1] * width / gray.size[0]))
+    pixels = np.array(gray.resize((width, height))) >> 4
+    return hashlib.sha256(pixels.astype(np.uint8).tobytes()).hexdigest()
+
+
+def safe_document_id(document_id):
+    """Filesystem-safe form of a document id, for manifest and output names."""
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in document_id)
+
+
+def table_fingerprint(df):
+    """Content hash of an extracted table, used to tell changed tables from re-extracted identical ones."""
+    return hashlib.sha256(df.to_csv(index=False).encode('utf-8')).hexdigest()
+
+
+class RunManifest:
+    """
+    Records, per document id, the page fingerprints and table outputs of the last run
+    so a revised document can be reprocessed only where its pages changed.
+    """
+
+    def __init__(self, document_id, pages=None, tables=None):
+        self.document_id = document_id
+        # page number (str, as stored in JSON) -> fingerprint
+        self.pages = pages or {}
+        # [{'table_id', 'page', 'table_index', 'content_hash', 'csv_path', 'json_path'}]
+        self.tables = tables or []
+
+    @staticmethod
+    def path_for(output_dir, document_id):
+        return os.path.join(output_dir, ".manifests", f"{safe_document_id(document_id)}.json")
+
+    @classmethod
+    def load(cls, output_dir, document_id):
+        path = cls.path_for(output_dir, document_id)
+        if not os.path.exists(path):
+            return cls(document_id)
+        with open(path) as f:
+            stored = json.load(f)
+        return cls(document_id, stored.get('pages'), stored.get('tables'))
+
+    def save(self, output_dir):
+        path = self.path_for(output_dir, self.document_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'document_id': self.document_id, 'pages': self.pages, 'tables': self.tables}, f, indent=4)
+
+    def match_pages(self, fingerprints):
+        """
+        Maps new page numbers to pages of the previous run. A page whose content matches a
+        previous page maps to it wherever it moved, so inserting or removing a page does not
+        mark every later page as changed. Any other page maps to the previous page at the
+        same position, if that page was not matched elsewhere, so its tables are diffed
+        against what it replaced. Returns (page_map, changed_pages).
+        """
+        unclaimed = {}
+        for page in sorted(self.pages, key=int):
+            unclaimed.setdefault(self.pages[page], []).append(int(page))
+        page_map = {}
+        # Same position first, so repeated pages (e.g. blanks) keep their own predecessor
+        for page, fp in enumerate(fingerprints):
+            if self.pages.get(str(page)) == fp:
+                page_map[page] = page
+                unclaimed[fp].remove(page)
+        for page, fp in enumerate(fingerprints):
+            if page not in page_map and unclaimed.get(fp):
+                page_map[page] = unclaimed[fp].pop(0)
+
+        changed = set(range(len(fingerprints))) - set(page_map)
+        claimed = set(page_map.values())
+        for page in sorted(changed):
+            if str(page) in self.pages and page not in claimed:
+                page_map[page] = page
+        return page_map, changed
+
+    def _load_verified(self, entry):
+        """
+        Reads a previous table output, returning (stored JSON, DataFrame) only if it still
+        belongs to this document and its content matches the manifest; otherwise None.
+        """
+        try:
+            with open(entry['json_path']) as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot reuse {entry['json_path']}: {e}")
+            return None
+        if stored.get('document_id') != self.document_id:
+            logger.warning(f"Cannot reuse {entry['json_path']}: now holds document {stored.get('document_id')!r}.")
+            return None
+        df = pd.DataFrame(stored.get('structured_data', []))
+        if table_fingerprint(df) != entry['content_hash']:
+            logger.warning(f"Cannot reuse {entry['json_path']}: content differs from the previous run.")
+            return None
+        return stored, df
+
+    def carried_results(self, unchanged_pages):
+        """
+        Rebuilds pipeline results for previous tables on unchanged pages from their JSON outputs.
+        unchanged_pages maps new page numbers to the previous run's page with the same content.
+        Returns (results, pages_to_reprocess): a page with any missing, overwritten or altered
+        table output is not carried forward and must be reprocessed instead.
+        """
+        new_pages = {old: new for new, old in unchanged_pages.items()}
+        loaded, invalid_pages = [], set()
+        for entry in self.tables:
+            if entry['page'] not in new_pages:
+                continue
+            verified = self._load_verified(entry)
+            if verified is None:
+                invalid_pages.add(new_pages[entry['page']])
+            else:
+                loaded.append((entry, *verified))
+
+        results = []
+        for entry, stored, df in loaded:
+            page = new_pages[entry['page']]
+            if page in invalid_pages:
+                continue
+            metadata = stored.get('metadata', {})
+            results.append({
+                'page': page,
+                'previous_page': entry['page'],
+                'table_index': entry['table_index'],
+                'df': df,
+                'confidence': stored.get('confidence_score', 0.0),
+                'cell_triage': metadata.get('cell_triage', {}),
+                'structure_cached': metadata.get('structure_cached', False),
+                'quality_tier': metadata.get('quality_tier', 'full'),
+                'content_hash': entry['content_hash'],
+                'carried_forward': True,
+                'source_csv': entry['csv_path'],
+                'source_json': entry['json_path']
+            })
+        return results, invalid_pages
+
+    def diff(self, results, table_ids, page_map):
+        """
+        Compares new results (exported under table_ids) against the previous run, keyed by
+        (page, table index on page) with new pages mapped to previous ones by page_map (see
+        match_pages). Returns the tables added, changed, removed or unchanged.
+        """
+        previous = {(t['page'], t['table_index']): t for t in self.tables}
+        report = {'added': [], 'changed': [], 'removed': [], 'unchanged': []}
+        seen = set()
+        for res, table_id in zip(results, table_ids):
+            key = (page_map.get(res['page']), res['table_index'])
+            seen.add(key)
+            entry = {'page': res['page'], 'table_index': res['table_index'], 'table_id': table_id}
+            content_hash = res.get('content_hash') or table_fingerprint(res['df'])
+            if key not in previous:
+                report['added'].append(entry)
+            elif previous[key]['content_hash'] != content_hash:
+                report['changed'].append(entry)
+            else:
+                report['unchanged'].append(entry)
+        for key, old in sorted(previous.items()):
+            if key not in seen:
+                report['removed'].append({'page': key[0], 'table_index': key[1], 'table_id': old['table_id']})
+        return report
+
+
+if __name__ == "__main__":
+    page = Image.new('RGB', (850, 1100), color='white')
+    manifest = RunManifest("smoke_doc")
+    print(f"Changed pages on first run: {manifest.match_pages([page_fingerprint(page)])[1]}")
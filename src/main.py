@@ -12,6 +12,7 @@ for noisy_lib in ['timm', 'transformers', 'PIL', 'pytorch_lightning']:
     logging.getLogger(noisy_lib).setLevel(logging.ERROR)
 
 from pipeline import OCRPipeline
+from incremental import safe_document_id
 from evaluator import PerformanceEvaluator
 
 logger = logging.getLogger(__name__)
@@ -19,8 +20,11 @@ logger.setLevel(logging.INFO)
 
 def main():
     # 1. Initialize Pipeline and Evaluator
-    pipeline = OCRPipeline()
-    evaluator = PerformanceEvaluator()
+    pipeline = OCRPipeline(
+        triage_threshold=float(os.getenv("TRIAGE_THRESHOLD", "0")),
+        structure_cache_path=os.getenv("STRUCTURE_CACHE") or None
+    )
+    evaluator = PerformanceEvaluator(store_path=os.getenv("METRICS_DB") or None)
     
     # 2. Define input (using relative paths or environment variables)
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -30,16 +34,32 @@ def main():
     logger.info(f"Starting End-to-End Pipeline Execution with: {input_file}")
 # 3. Process Document
     doc_id = os.path.basename(input_file)
+    # Per-document output names, so consecutive documents do not overwrite each other
+    base_name = f"final_run_{safe_document_id(os.path.splitext(doc_id)[0])}"
     logger.info(f"Processing: {input_file}")
-    results = pipeline.process_document(input_file)
-    
-    # 4. Export Results (CSV/JSON per table) with enhanced formatting
-    exported_files = pipeline.export(results, "final_run", document_id=doc_id)
+    if os.getenv("INCREMENTAL", "0") == "1":
+        # Only pages changed since the previous run of this document are reprocessed
+        results, exported_files, _ = pipeline.process_incremental(input_file, base_name, document_id=doc_id)
+    else:
+        calibrate_triage = os.getenv("TRIAGE_CALIBRATE", "0") == "1"
+        time_budget = float(os.getenv("TIME_BUDGET_S", "0")) or None
+        results = pipeline.process_document(input_file, calibrate_triage=calibrate_triage, time_budget=time_budget)
+        
+        # 4. Export Results (CSV/JSON per table) with enhanced formatting
+        exported_files = pipeline.export(results, base_name, document_id=doc_id)
     logger.info(f"Exported {len(exported_files)} structured data files.")
     
     # 5. Collect Validation Errors and Generate Professional Report
     validation_errors = []
     for r_idx, res in enumerate(results):
+        if res.get('skipped_page'):
+            validation_errors.append({
+                'id': f"T{r_idx}",
+                'type': 'PAGE_SKIPPED',
+                'src': f"Page {res['page']} (latency budget)",
+                'conf': 0.0
+            })
+            continue
         # res['df'] contains the structured table
         # We can flag rows/cells with low confidence if needed, 
         # but evaluator.validate_results expects the raw cell list.
@@ -52,12 +72,12 @@ def main():
                 'conf': res.get('confidence', 0.0)
             })
     
-    evaluator.update_from_pipeline(results)
-    report_path = evaluator.generate_report(validation_errors=validation_errors)
+    evaluator.record_document(doc_id, results, stage_times=pipeline.stage_times)
+    report_path = evaluator.generate_report(validation_errors=validation_errors, since=os.getenv("REPORT_SINCE") or None)
     logger.info(f"Quality Report generated at: {report_path}")
     expected_files = [
-        os.path.join(base_dir, "data", "processed", "final_run_t0.csv"),
-        os.path.join(base_dir, "data", "processed", "final_run_t0.json"),
+        os.path.join(base_dir, "data", "processed", f"{base_name}_t0.csv"),
+        os.path.join(base_dir, "data", "processed", f"{base_name}_t0.json"),
         os.path.join(base_dir, "data", "processed", "quality_report.pdf")
     ]
     
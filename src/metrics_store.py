@@ -0,0 +1,204 @@
+import os
+import math
+import time
+import sqlite3
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    ts REAL NOT NULL,
+    document_id TEXT NOT NULL,
+    table_count INTEGER NOT NULL,
+    avg_confidence REAL,
+    latency_s REAL,
+    quality_tier TEXT
+);
+CREATE TABLE IF NOT EXISTS tables (
+    ts REAL NOT NULL,
+    document_id TEXT NOT NULL,
+    page INTEGER,
+    table_index INTEGER,
+    confidence REAL,
+    low_confidence INTEGER NOT NULL,
+    quality_tier TEXT
+);
+CREATE TABLE IF NOT EXISTS stages (
+    ts REAL NOT NULL,
+    document_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS histograms (
+    metric TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (metric, hour, bin)
+);
+CREATE INDEX IF NOT EXISTS idx_documents_ts ON documents (ts);
+CREATE INDEX IF NOT EXISTS idx_tables_ts ON tables (ts);
+CREATE INDEX IF NOT EXISTS idx_stages_ts ON stages (ts);
+"""
+
+
+def _confidence_bin(value):
+    """100 linear bins over [0, 1]."""
+    return min(99, max(0, int(value * 100)))
+
+
+def _confidence_value(bin_idx):
+    """Bin midpoint, so the estimate is off by at most half a bin either way."""
+    return (bin_idx + 0.5) / 100
+
+
+def _latency_bin(seconds):
+    """20 log-spaced bins per decade, starting at 1 ms."""
+    return max(0, int(math.floor(math.log10(max(seconds, 1e-3)) * 20)) + 60)
+
+
+def _latency_value(bin_idx):
+    """Geometric bin midpoint, matching the log spacing."""
+    return 10 ** ((bin_idx - 59.5) / 20)
+
+
+def hour_window(start=None, end=None):
+    """Widens [start, end) epoch seconds to whole hours, the resolution of the histograms."""
+    return (math.floor(start / 3600) * 3600 if start is not None else None,
+            math.ceil(end / 3600) * 3600 if end is not None else None)
+
+
+class MetricsStore:
+    """
+    Append-only SQLite store of per-document, per-table and per-stage metrics.
+
+    Alongside the raw rows, confidence and latency values are folded into hourly
+    histogram buckets as they arrive, so percentiles over any window are computed
+    from a few hundred bucket counts instead of the raw rows. Summaries therefore
+    cover whole hours: the requested window is widened to hour boundaries.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        # Rollback journal rather than WAL, so queue workers on several hosts can share the file
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+
+    def _observe(self, metric, bin_idx, hour):
+        self.conn.execute(
+            "INSERT INTO histograms (metric, hour, bin, count) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT (metric, hour, bin) DO UPDATE SET count = count + 1",
+            (metric, hour, bin_idx)
+        )
+
+    def record_document(self, document_id, results, stage_times=None, confidence_threshold=0.85, ts=None):
+        """
+        Appends one document run: its tables, stage timings and histogram observations.
+        Tables carried forward from a previous run were recorded by that run and are skipped.
+        """
+        ts = ts if ts is not None else time.time()
+        hour = int(ts // 3600)
+        stage_times = stage_times or {}
+        latency = sum(stage_times.values()) if stage_times else None
+        results = [res for res in results if not res.get('carried_forward')]
+        tiers = {res.get('quality_tier', 'full') for res in results}
+        # Placeholders for pages skipped under a latency budget are not tables
+        results = [res for res in results if not res.get('skipped_page')]
+        confidences = [res.get('confidence', 0.0) for res in results]
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                (ts, document_id, len(results),
+                 sum(confidences) / len(confidences) if confidences else None,
+                 latency, ",".join(sorted(tiers)) or None)
+            )
+            self.conn.executemany(
+                "INSERT INTO tables VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(ts, document_id, res.get('page'), res.get('table_index'), res.get('confidence', 0.0),
+                  int(res.get('confidence', 0.0) < confidence_threshold), res.get('quality_tier', 'full'))
+                 for res in results]
+            )
+            self.conn.executemany(
+                "INSERT INTO stages VALUES (?, ?, ?, ?)",
+                [(ts, document_id, stage, seconds) for stage, seconds in stage_times.items()]
+            )
+            for conf in confidences:
+                self._observe('confidence', _confidence_bin(conf), hour)
+            if latency is not None:
+                self._observe('latency:document', _latency_bin(latency), hour)
+            for stage, seconds in stage_times.items():
+                self._observe(f'latency:{stage}', _latency_bin(seconds), hour)
+
+    def percentiles(self, metric, quantiles=(0.5, 0.9, 0.99), start=None, end=None):
+        """Approximate quantiles of a histogram metric over the whole hours covering [start, end) epoch seconds."""
+        start, end = hour_window(start, end)
+        clauses, params = ["metric = ?"], [metric]
+        if start is not None:
+            clauses.append("hour >= ?")
+            params.append(start // 3600)
+        if end is not None:
+            clauses.append("hour < ?")
+            params.append(end // 3600)
+        rows = self.conn.execute(
+            f"SELECT bin, SUM(count) FROM histograms WHERE {' AND '.join(clauses)} GROUP BY bin ORDER BY bin",
+            params
+        ).fetchall()
+        total = sum(count for _, count in rows)
+        if not total:
+            return {q: None for q in quantiles}
+
+        to_value = _confidence_value if metric == 'confidence' else _latency_value
+        result, cumulative, idx = {}, 0, 0
+        for q in sorted(quantiles):
+            while idx < len(rows) and cumulative + rows[idx][1] < q * total:
+                cumulative += rows[idx][1]
+                idx += 1
+            result[q] = to_value(rows[min(idx, len(rows) - 1)][0])
+        return result
+
+    def stage_names(self, start=None, end=None):
+        return [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT stage FROM stages WHERE ts >= ? AND ts < ? ORDER BY stage",
+            (start if start is not None else 0, end if end is not None else float('inf'))
+        )]
+
+    def summary(self, start=None, end=None):
+        """
+        Aggregated metrics over [start, end) epoch seconds, computed inside SQLite. The window
+        is widened to whole hours so counts and percentiles cover the same documents; the
+        window actually used is returned as (start, end), None meaning unbounded.
+        """
+        start, end = hour_window(start, end)
+        window = (start if start is not None else 0, end if end is not None else float('inf'))
+        docs, doc_tables = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(table_count), 0) FROM documents WHERE ts >= ? AND ts < ?", window
+        ).fetchone()
+        avg_conf, low_flags = self.conn.execute(
+            "SELECT AVG(confidence), COALESCE(SUM(low_confidence), 0) FROM tables WHERE ts >= ? AND ts < ?", window
+        ).fetchone()
+        return {
+            "window": (start, end),
+            "processed_docs": docs,
+            "table_count": doc_tables,
+            "ocr_avg_confidence": avg_conf or 0.0,
+            "low_confidence_flags": low_flags,
+            "confidence_percentiles": self.percentiles('confidence', start=start, end=end),
+            "latency_percentiles": {
+                name: self.percentiles(f'latency:{name}', start=start, end=end)
+                for name in ['document'] + self.stage_names(start, end)
+            }
+        }
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    store = MetricsStore(":memory:")
+    store.record_document("smoke_doc", [{'confidence': 0.92, 'page': 0, 'table_index': 0}], {'ocr': 1.5})
+    print(store.summary())
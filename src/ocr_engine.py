@@ -1,5 +1,5 @@
 import torch
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel, logging as transformers_logging
+from transformers import TrOCRProcessor, VisionEncoderDecoderModel, LogitsProcessor, LogitsProcessorList, logging as transformers_logging
 from PIL import Image
 import logging
 import warnings
@@ -11,6 +11,24 @@ logger = logging.getLogger(__name__)
 # Inherit settings but explicitly set this component to INFO if needed for its own logs
 logger.setLevel(logging.INFO)
 
+# Characters each decoding hint may produce
+CHAR_CLASSES = {
+    "numeric": set("0123456789.,()-+$€£¥% —–")
+}
+
+# Below this raw probability mass on the allowed tokens (first decoding step) the
+# cell is probably not a figure (e.g. 'N/A', 'n.m.'), so the constraint is dropped
+MIN_ALLOWED_MASS = 0.5
+
+class AllowedTokensLogitsProcessor(LogitsProcessor):
+    """Masks every token outside a precomputed allowed set before beam scoring."""
+
+    def __init__(self, allowed_mask):
+        self.allowed_mask = allowed_mask
+
+    def __call__(self, input_ids, scores):
+        return scores.masked_fill(~self.allowed_mask[:scores.shape[-1]], float("-inf"))
+
 class OCREngine:
     """Handles text extraction from cell images using Microsoft TrOCR."""
     
@@ -20,41 +38,79 @@ class OCREngine:
         
         self.processor = TrOCRProcessor.from_pretrained(model_name)
         self.model = VisionEncoderDecoderModel.from_pretrained(model_name).to(self.device)
+        self._allowed_masks = {}
 
-    def extract_text(self, cell_image, num_beams=5):
+    def _allowed_mask(self, char_class):
+        """Builds (once per class) a vocabulary mask of tokens made only of the class's characters."""
+        if char_class not in self._allowed_masks:
+            allowed_chars = CHAR_CLASSES[char_class]
+            tokenizer = self.processor.tokenizer
+            vocab_size = max(len(tokenizer), self.model.config.decoder.vocab_size)
+            mask = torch.zeros(vocab_size, dtype=torch.bool)
+            for token_id in range(len(tokenizer)):
+                token_text = tokenizer.decode([token_id])
+                if token_text and set(token_text) <= allowed_chars:
+                    mask[token_id] = True
+            mask[tokenizer.eos_token_id] = True
+            self._allowed_masks[char_class] = mask.to(self.device)
+            logger.info(f"Constrained vocabulary '{char_class}': {int(mask.sum())} tokens.")
+        return self._allowed_masks[char_class]
+
+    def extract_text(self, cell_image, num_beams=5, max_new_tokens=64, char_class=None):
         """
         Extracts text and confidence from a cropped cell image using optimized beam search.
+        char_class (e.g. 'numeric') restricts generation to tokens from CHAR_CLASSES,
+        unless the model puts little probability on those tokens, in which case the cell
+        is decoded unconstrained. Confidence always comes from the unconstrained logits.
         """
         if cell_image.size[0] == 0 or cell_image.size[1] == 0:
             return "", 0.0
             
         pixel_values = self.processor(images=cell_image, return_tensors="pt").pixel_values.to(self.device)
         
+        logits_processor = None
+        if char_class is not None:
+            logits_processor = LogitsProcessorList([AllowedTokensLogitsProcessor(self._allowed_mask(char_class))])
+
         # Optimized generation with Beam Search
         generated_ids = self.model.generate(
             pixel_values, 
             return_dict_in_generate=True, 
             output_scores=True,
+            output_logits=True,
             num_beams=num_beams,
             early_stopping=True,
-            max_new_tokens=64
+            max_new_tokens=max_new_tokens,
+            logits_processor=logits_processor
         )
         
+        # Raw logits, before any logits processor: a constrained vocabulary must not
+        # renormalise the confidence over the allowed tokens only
+        logits = torch.stack(generated_ids.logits, dim=1)  # [batch * beams, seq_len, vocab]
+        probs = torch.softmax(logits.float(), dim=-1)
+
+        if char_class is not None:
+            allowed_mass = probs[0, 0, self._allowed_mask(char_class)[:probs.size(-1)]].sum().item()
+            if allowed_mass < MIN_ALLOWED_MASS:
+                logger.debug(f"Allowed-token mass {allowed_mass:.2f} for '{char_class}', decoding unconstrained.")
+                return self.extract_text(cell_image, num_beams=num_beams, max_new_tokens=max_new_tokens)
+
         generated_text = self.processor.batch_decode(generated_ids.sequences, skip_special_tokens=True)[0]
         
-        # Calculating confidence score using sequence transition probabilities
-        # TrOCR sequences include the initial start token, so we align scores accordingly
-        logits = torch.stack(generated_ids.scores, dim=1)  # [batch, seq_len, vocab]
-        probs = torch.softmax(logits, dim=-1)
-        
         # Map the generated IDs (excluding start token) to their probabilities
         # sequence format: [SOS, ID1, ID2, ..., EOS]
         seq_ids = generated_ids.sequences[0, 1:] 
+        # With beam search, follow the beam each token was actually taken from
+        beam_indices = getattr(generated_ids, "beam_indices", None)
         
         confidences = []
         for i, token_id in enumerate(seq_ids):
-            if i < probs.size(1):
-                confidences.append(probs[0, i, token_id].item())
+            if i >= probs.size(1):
+                break
+            beam = beam_indices[0, i].item() if beam_indices is not None else 0
+            if beam < 0:
+                break
+            confidences.append(probs[beam, i, token_id].item())
         
         confidence = sum(confidences) / len(confidences) if confidences else 0.0
         
@@ -8,55 +8,228 @@ try:
     from src.table_detector import TableDetector
     from src.ocr_engine import OCREngine
     from src.processor import TableProcessor
+    from src.triage import PageTriage, CellTriage
+    from src.structure_cache import StructureCache
+    from src.incremental import RunManifest, page_fingerprint, table_fingerprint
+    from src.scheduler import StageTimer, DeadlineScheduler, QUALITY_TIERS, EXHAUSTED_TIER, SKIPPED_TIER
 except ImportError:
     from document_loader import DocumentLoader
     from table_detector import TableDetector
     from ocr_engine import OCREngine
     from processor import TableProcessor
+    from triage import PageTriage, CellTriage
+    from structure_cache import StructureCache
+    from incremental import RunManifest, page_fingerprint, table_fingerprint
+    from scheduler import StageTimer, DeadlineScheduler, QUALITY_TIERS, EXHAUSTED_TIER, SKIPPED_TIER
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class OCRPipeline:
-    def __init__(self):
+    def __init__(self, triage_threshold=0.0, structure_cache_path=None):
         self.loader = DocumentLoader()
         self.detector = TableDetector()
         self.ocr = OCREngine()
         self.processor = TableProcessor()
+        # Off by default: a threshold of 0 skips no page; set it from a calibration run
+        self.triage = PageTriage(threshold=triage_threshold)
+        self.cell_triage = CellTriage()
+        self.structure_cache = StructureCache(cache_path=structure_cache_path)
+        # Cheaper decoding for short numeric-like cells
+        self.numeric_decode = {'num_beams': 2, 'max_new_tokens': 16}
+        # Numeric cells in confirmed numeric columns: restricted vocabulary, greedy decoding
+        self.constrained_decode = {'num_beams': 1, 'max_new_tokens': 16, 'char_class': 'numeric'}
+        # Consecutive numeric body cells needed before a column is treated as numeric
+        self.numeric_confirm_cells = 2
+        # Seconds spent per stage on the last processed document
+        self.stage_times = {}
 
-    def process_document(self, file_path):
+    def process_document(self, file_path, calibrate_triage=False, time_budget=None):
+        """
+        Detects, OCRs and reconstructs every table in the document.
+        With calibrate_triage=True the detector runs on every page and the triage
+        scores are recorded against its output instead of skipping pages.
+        With time_budget (seconds) a DeadlineScheduler steps down beam width and
+        cell coverage as the budget runs low; each result records its 'quality_tier'.
+        """
         logger.info(f"Processing document: {file_path}")
-        images = self.loader.load(file_path)
+        timer = DeadlineScheduler(time_budget) if time_budget else StageTimer()
+        with timer.stage('load'):
+            images = self.loader.load(file_path)
+        return self.process_images(images, calibrate_triage=calibrate_triage, timer=timer)
+
+    def _decode_args(self, config, tier):
+        """Caps a decoding configuration's beam width at the quality tier's."""
+        args = dict(config)
+        args['num_beams'] = min(args.get('num_beams', 5), tier['num_beams'])
+        return args
+
+    def process_images(self, images, calibrate_triage=False, pages=None, timer=None):
+        """Runs table extraction on loaded page images, restricted to `pages` when given."""
+        timer = timer or StageTimer()
+        budgeted = isinstance(timer, DeadlineScheduler)
         all_results = []
+        skipped_pages = 0
+        pages_done = 0
+        if calibrate_triage:
+            # Calibration reports cover the current document only
+            self.triage.reset_calibration()
+        doc_triage = dict.fromkeys(CellTriage.LABELS, 0)
+        total_pages = len(images) if pages is None else len(pages)
 
         for page_num, image in enumerate(images):
-            tables = self.detector.detect_tables(image)
+            if pages is not None and page_num not in pages:
+                continue
+            tier = QUALITY_TIERS[0]
+            if budgeted:
+                if timer.exhausted():
+                    logger.warning(f"Page {page_num}: latency budget exhausted, skipping page.")
+                    timer.pages_skipped += 1
+                    # Placeholder so the skipped page is visible in the exported results
+                    all_results.append({
+                        'page': page_num,
+                        'table_index': -1,
+                        'df': pd.DataFrame(),
+                        'confidence': 0.0,
+                        'cell_triage': {},
+                        'quality_tier': SKIPPED_TIER,
+                        'skipped_cells': 0,
+                        'skipped_page': True
+                    })
+                    continue
+                tier = timer.select_tier(pages_done, total_pages)
+            pages_done += 1
+
+            triage_score = None
+            if calibrate_triage or self.triage.threshold > 0:
+                with timer.stage('triage'):
+                    triage_score = self.triage.score(image)
+            if triage_score is not None and self.triage.should_skip(triage_score) and not calibrate_triage:
+                logger.info(f"Page {page_num}: triage score {triage_score:.3f}, skipping table detection.")
+                skipped_pages += 1
+                continue
+
+            with timer.stage('detection'):
+                tables = self.detector.detect_tables(image)
+            if calibrate_triage:
+                self.triage.record(triage_score, len(tables))
             for table_idx, table in enumerate(tables):
                 table_box = table['box']
-                structure = self.detector.recognize_structure(image, table_box)
                 table_image = image.crop(table_box)
+                with timer.stage('structure'):
+                    structure, template_similarity = self.structure_cache.lookup(table_image)
+                    structure_cached = structure is not None
+                    if not structure_cached:
+                        structure = self.detector.recognize_structure(image, table_box)
+                        self.structure_cache.store(table_image, structure)
                 
                 cells = [s for s in structure if s['label'] == 'table cells']
                 rows = sorted([s for s in structure if s['label'] == 'table row'], key=lambda x: x['box'][1])
                 cols = sorted([s for s in structure if s['label'] == 'table column'], key=lambda x: x['box'][0])
                 
+                located = []
+                table_triage = dict.fromkeys(CellTriage.LABELS, 0)
+                with timer.stage('cell_triage'):
+                    for cell in cells:
+                        cbox = cell['box']
+                        cx, cy = (cbox[0] + cbox[2])/2, (cbox[1] + cbox[3])/2
+                        row_idx = next((i for i, r in enumerate(rows) if r['box'][1] <= cy <= r['box'][3]), -1)
+                        col_idx = next((i for i, c in enumerate(cols) if c['box'][0] <= cx <= c['box'][2]), -1)
+                        cell_img = table_image.crop(cbox)
+                        cell_class = self.cell_triage.classify(cell_img)
+                        table_triage[cell_class] += 1
+                        located.append((row_idx, col_idx, cbox, cell_img, cell_class))
+
+                # Under reduced coverage, header cells go first, then numeric-like cells, then text
+                ocr_candidates = sorted(
+                    (i for i, c in enumerate(located) if c[4] != 'blank'),
+                    key=lambda i: (located[i][0] != 0, located[i][4] != 'numeric', located[i][0], located[i][1])
+                )
+                if budgeted:
+                    tier = timer.select_tier_for_cells(len(ocr_candidates))
+                coverage_limit = int(round(tier['cell_coverage'] * len(ocr_candidates)))
+                selected = set(ocr_candidates[:coverage_limit])
+                unread = set(selected)
+
+                # Walk each column top-down so numeric columns can be confirmed before
+                # their remaining cells are decoded with the restricted vocabulary
                 processed_cells = []
-                for cell in cells:
-                    cbox = cell['box']
-                    cell_img = table_image.crop(cbox)
-                    text, conf = self.ocr.extract_text(cell_img)
-                    cx, cy = (cbox[0] + cbox[2])/2, (cbox[1] + cbox[3])/2
-                    row_idx = next((i for i, r in enumerate(rows) if r['box'][1] <= cy <= r['box'][3]), -1)
-                    col_idx = next((i for i, c in enumerate(cols) if c['box'][0] <= cx <= c['box'][2]), -1)
-                    processed_cells.append({'text': text, 'conf': conf, 'row': row_idx, 'col': col_idx, 'box': cbox})
+                skipped_cells = 0
+                budget_dropped = 0
+                numeric_streak, confirmed_cols = {}, set()
+                for i in sorted(range(len(located)), key=lambda i: (located[i][1], located[i][0])):
+                    row_idx, col_idx, cbox, cell_img, cell_class = located[i]
+                    if budgeted and i in unread:
+                        # Re-project before every read so the tier can drop mid-page
+                        new_tier = timer.select_tier_for_cells(len(unread))
+                        if new_tier is not tier:
+                            tier = new_tier
+                            coverage_limit = int(round(tier['cell_coverage'] * len(ocr_candidates)))
+                            # Cells already read stay read; the rest is trimmed in priority order
+                            selected = {c for c in ocr_candidates[:coverage_limit] if c in unread} | (selected - unread)
+                            unread &= selected
+                    out_of_budget = budgeted and row_idx != 0 and timer.exhausted()
+                    if cell_class == 'blank':
+                        text, conf = "", None
+                    elif i not in selected or out_of_budget:
+                        skipped_cells += 1
+                        budget_dropped += i in selected
+                        text, conf = None, None
+                    else:
+                        with timer.stage('ocr'):
+                            if cell_class == 'numeric' and col_idx in confirmed_cols:
+                                text, conf = self.ocr.extract_text(cell_img, **self._decode_args(self.constrained_decode, tier))
+                            elif cell_class == 'numeric':
+                                text, conf = self.ocr.extract_text(cell_img, **self._decode_args(self.numeric_decode, tier))
+                            else:
+                                text, conf = self.ocr.extract_text(cell_img, **self._decode_args({}, tier))
+                        if budgeted:
+                            timer.cells_read += 1
+                            unread.discard(i)
+
+                    # Header row never counts towards confirming a numeric column, and cells
+                    # matching no column (col_idx -1) do not form a column at all
+                    if text and row_idx > 0 and col_idx >= 0 and col_idx not in confirmed_cols:
+                        if self.processor.is_numeric_text(text):
+                            numeric_streak[col_idx] = numeric_streak.get(col_idx, 0) + 1
+                            if numeric_streak[col_idx] >= self.numeric_confirm_cells:
+                                confirmed_cols.add(col_idx)
+                        else:
+                            numeric_streak[col_idx] = 0
+                    processed_cells.append({'text': text, 'conf': conf, 'row': row_idx, 'col': col_idx, 'box': cbox,
+                                            'class': cell_class, 'skipped': text is None})
                 
-                df = self.processor.process_table(processed_cells)
+                for label, count in table_triage.items():
+                    doc_triage[label] += count
+
+                # Blank and skipped cells were never OCR'd, so they do not contribute to confidence
+                ocr_confs = [c['conf'] for c in processed_cells if c['conf'] is not None]
+                with timer.stage('reconstruct'):
+                    df = self.processor.process_table(processed_cells)
                 all_results.append({
                     'page': page_num,
                     'table_index': table_idx,
                     'df': df,
-                    'confidence': sum([c['conf'] for c in processed_cells]) / (len(processed_cells) + 1e-6)
+                    'confidence': sum(ocr_confs) / (len(ocr_confs) + 1e-6),
+                    'cell_triage': table_triage,
+                    'structure_cached': structure_cached,
+                    'template_similarity': template_similarity,
+                    # Cells the tier meant to read but the deadline dropped downgrade the label
+                    'quality_tier': EXHAUSTED_TIER if budget_dropped else tier['name'],
+                    'skipped_cells': skipped_cells
                 })
+
+        if calibrate_triage:
+            logger.info(f"Triage calibration: {self.triage.calibration_report()}")
+        elif skipped_pages:
+            logger.info(f"Triage skipped {skipped_pages}/{len(images)} pages.")
+        logger.info(f"Cell triage: {doc_triage['blank']} blank (OCR skipped), "
+                    f"{doc_triage['numeric']} numeric (reduced decoding), {doc_triage['text']} text.")
+        logger.info(f"Structure templates: {self.structure_cache.hits} hits, {self.structure_cache.misses} misses.")
+        if budgeted:
+            logger.info(f"Latency budget: {timer.summary()}")
+        self.structure_cache.save()
+        self.stage_times = dict(timer.stage_times)
         return all_results
 
     def export(self, results, base_name, output_dir=None, document_id="unknown_doc"):
@@ -74,6 +247,12 @@ class OCRPipeline:
             csv_path = os.path.join(output_dir, f"{base_name}_t{i}.csv")
             json_path = os.path.join(output_dir, f"{base_name}_t{i}.json")
             
+            # Carried-forward tables already on disk under the same id and page need no rewrite
+            if (res.get('carried_forward') and res.get('previous_page') == res['page']
+                    and res.get('source_json') == json_path and res.get('source_csv') == csv_path):
+                exported_files.extend([csv_path, json_path])
+                continue
+
             # Subtask 2: Enhance CSV generation
             df = res['df']
             # Ensure headers are strings and clean
@@ -81,7 +260,8 @@ class OCRPipeline:
             df.to_csv(csv_path, index=False, quoting=1) # Quote all non-numeric for cleanliness
             
             # Subtask 1: Strict JSON schema
-            all_text = " ".join(df.values.flatten().astype(str))
+            # Unread (budget-skipped) cells are null and contribute no text
+            all_text = " ".join(str(v) for v in df.values.flatten() if pd.notna(v))
             
             structured_output = {
                 "document_id": document_id,
@@ -93,6 +273,11 @@ class OCRPipeline:
                     "table_index_on_page": res['table_index'],
                     "row_count": len(df),
                     "column_count": len(df.columns),
+                    "cell_triage": res.get('cell_triage', {}),
+                    "structure_cached": res.get('structure_cached', False),
+                    "quality_tier": res.get('quality_tier', QUALITY_TIERS[0]['name']),
+                    "skipped_cells": res.get('skipped_cells', 0),
+                    "skipped_page": res.get('skipped_page', False),
                     "execution_timestamp": pd.Timestamp.now().isoformat()
                 },
                 "structured_data": df.to_dict(orient='records')
@@ -105,6 +290,65 @@ class OCRPipeline:
             
         return exported_files
 
+    def process_incremental(self, file_path, base_name, output_dir=None, document_id="unknown_doc"):
+        """
+        Reprocesses only pages whose content changed since the previous run of document_id,
+        carries forward the tables of unchanged pages and exports the combined result.
+        base_name should be unique per document (outputs are named <base_name>_t{i}).
+        Returns (results, exported_files, diff) where diff lists tables added, changed,
+        removed or unchanged; the diff is also written to <base_name>_diff.json.
+        """
+        if output_dir is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            output_dir = os.path.join(base_dir, "data", "processed")
+
+        logger.info(f"Incremental processing: {file_path} ({document_id})")
+        images = self.loader.load(file_path)
+        fingerprints = [page_fingerprint(image) for image in images]
+        manifest = RunManifest.load(output_dir, document_id)
+        page_map, changed = manifest.match_pages(fingerprints)
+        unchanged = {page: page_map[page] for page in range(len(images)) if page not in changed}
+        moved = sum(1 for page, old in unchanged.items() if page != old)
+        logger.info(f"{len(changed)}/{len(images)} pages new or changed; carrying forward {len(unchanged)} "
+                    f"({moved} moved).")
+
+        results, invalid_pages = manifest.carried_results(unchanged)
+        if invalid_pages:
+            logger.warning(f"Previous outputs unusable for pages {sorted(invalid_pages)}; reprocessing them.")
+            changed |= invalid_pages
+        if changed:
+            results.extend(self.process_images(images, pages=changed))
+        results.sort(key=lambda r: (r['page'], r['table_index']))
+
+        exported_files = self.export(results, base_name, output_dir=output_dir, document_id=document_id)
+        table_ids = [f"{base_name}_t{i}" for i in range(len(results))]
+        diff = manifest.diff(results, table_ids, page_map)
+
+        # Outputs of the previous run that no longer correspond to a table
+        current_files = set(exported_files)
+        for entry in manifest.tables:
+            for path in (entry['csv_path'], entry['json_path']):
+                if path not in current_files and os.path.exists(path):
+                    os.remove(path)
+
+        manifest.pages = {str(page): fp for page, fp in enumerate(fingerprints)}
+        manifest.tables = [{
+            'table_id': table_id,
+            'page': res['page'],
+            'table_index': res['table_index'],
+            'content_hash': res.get('content_hash') or table_fingerprint(res['df']),
+            'csv_path': os.path.join(output_dir, f"{table_id}.csv"),
+            'json_path': os.path.join(output_dir, f"{table_id}.json")
+        } for res, table_id in zip(results, table_ids)]
+        manifest.save(output_dir)
+
+        diff_path = os.path.join(output_dir, f"{base_name}_diff.json")
+        with open(diff_path, 'w') as f:
+            json.dump({"document_id": document_id, **diff}, f, indent=4)
+        logger.info(f"Incremental diff: {len(diff['added'])} added, {len(diff['changed'])} changed, "
+                    f"{len(diff['removed'])} removed, {len(diff['unchanged'])} unchanged.")
+        return results, exported_files, diff
+
 if __name__ == "__main__":
     pipeline = OCRPipeline()
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -11,9 +11,19 @@ logger = logging.getLogger(__name__)
 class TableProcessor:
     """Processes OCR results into structured DataFrames and provides image enhancement."""
     
+    # Columns whose cells average above this digit ratio are treated as financial figures
+    NUMERIC_DIGIT_RATIO = 0.4
+
     def __init__(self):
         pass
 
+    def digit_ratio(self, text):
+        text = str(text)
+        return len(re.findall(r'\d', text)) / (len(text) + 1)
+
+    def is_numeric_text(self, text):
+        return self.digit_ratio(text) > self.NUMERIC_DIGIT_RATIO
+
     def preprocess_image(self, pil_image):
         """
         Performs advanced image enhancement:
@@ -53,6 +63,7 @@ class TableProcessor:
         """
         Reconstructs a table from cell data.
         cells: list of dicts with {'text': str, 'conf': float, 'row': int, 'col': int}
+        Cells marked 'skipped' (never read) come out as None rather than ''.
         """
         if not cells:
             return pd.DataFrame()
@@ -66,10 +77,19 @@ class TableProcessor:
             aggfunc=lambda x: ' '.join(str(v) for v in x if v)
         ).fillna('')
         
+        if 'skipped' in df.columns:
+            unread = df[df['skipped'].fillna(False).astype(bool)]
+            for row, col in zip(unread['row'], unread['col']):
+                if row in pivot_df.index and col in pivot_df.columns and pivot_df.at[row, col] == '':
+                    pivot_df.at[row, col] = None
+        
         return pivot_df
 
     def normalize_financial_text(self, text):
         """Cleans and normalizes financial strings."""
+        if text is None:
+            # Unread cell: not a zero
+            return None
         if not text:
             return "0.00"
             
@@ -94,8 +114,8 @@ class TableProcessor:
         
         # Apply normalization to potential financial columns (heuristic: columns with lots of digits)
         for col in df.columns:
-            digit_ratio = df[col].apply(lambda x: len(re.findall(r'\d', str(x))) / (len(str(x)) + 1)).mean()
-            if digit_ratio > 0.4:
+            digit_ratio = df[col].dropna().apply(self.digit_ratio).mean()
+            if digit_ratio > self.NUMERIC_DIGIT_RATIO:
                 df[col] = df[col].apply(self.normalize_financial_text)
                 
         return df
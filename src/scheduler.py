@@ -0,0 +1,115 @@
+import time
+import logging
+from contextlib import contextmanager
+from collections import defaultdict
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ordered from best quality to cheapest. cell_coverage is the fraction of non-blank
+# cells that are OCR'd, filled in priority order (header row, numeric cells, text).
+# Resolution is not a tier setting: both models resize their inputs to a fixed size,
+# so downscaling a rendered page costs quality without saving model time.
+QUALITY_TIERS = [
+    {"name": "full", "num_beams": 5, "cell_coverage": 1.0},
+    {"name": "reduced", "num_beams": 3, "cell_coverage": 1.0},
+    {"name": "fast", "num_beams": 1, "cell_coverage": 0.6},
+    {"name": "minimal", "num_beams": 1, "cell_coverage": 0.25},
+]
+# Labels for work cut short by the deadline rather than by a planned tier:
+# body cells dropped mid-table, and pages never processed
+EXHAUSTED_TIER = "exhausted"
+SKIPPED_TIER = "skipped"
+
+
+class StageTimer:
+    """Accumulates wall-clock time per pipeline stage."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.stage_times = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stage_times[name] += time.monotonic() - t0
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+
+class DeadlineScheduler(StageTimer):
+    """
+    Degrades extraction quality so a document finishes within a time budget.
+
+    Before each page the projected total time (elapsed / fraction of pages done)
+    is compared against the budget; while it overshoots, the scheduler steps down
+    one quality tier. Within a page, the projection is repeated from the OCR time
+    per cell read so far against the cells still to read, so a single-page document
+    can degrade too. Tiers never step back up within a document.
+    """
+
+    def __init__(self, budget_s, tiers=None):
+        super().__init__()
+        self.budget_s = budget_s
+        self.tiers = tiers or QUALITY_TIERS
+        self.tier_index = 0
+        self.pages_skipped = 0
+        self.cells_read = 0
+
+    @property
+    def tier(self):
+        return self.tiers[self.tier_index]
+
+    def remaining(self):
+        return self.budget_s - self.elapsed()
+
+    def exhausted(self):
+        return self.remaining() <= 0
+
+    def _step_down(self, projected):
+        while projected > self.budget_s and self.tier_index < len(self.tiers) - 1:
+            self.tier_index += 1
+            # Assume each step down roughly halves the remaining cost
+            projected = self.elapsed() + (projected - self.elapsed()) / 2
+            logger.info(f"Latency budget: stepping down to '{self.tier['name']}' "
+                        f"({self.elapsed():.1f}s of {self.budget_s:.1f}s used).")
+
+    def select_tier(self, pages_done, total_pages):
+        """Returns the quality tier to use for the next page."""
+        if pages_done > 0:
+            self._step_down(self.elapsed() * total_pages / pages_done)
+        return self.tier
+
+    def select_tier_for_cells(self, cells_remaining):
+        """Returns the quality tier to use for the next cell, given the cells still to read."""
+        if self.cells_read > 0:
+            per_cell = self.stage_times['ocr'] / self.cells_read
+            self._step_down(self.elapsed() + per_cell * cells_remaining)
+        return self.tier
+
+    def summary(self):
+        return {
+            "budget_s": self.budget_s,
+            "elapsed_s": round(self.elapsed(), 3),
+            "final_tier": self.tier["name"],
+            "pages_skipped": self.pages_skipped,
+            "cells_read": self.cells_read,
+            "stage_times": {k: round(v, 3) for k, v in self.stage_times.items()}
+        }
+
+
+if __name__ == "__main__":
+    scheduler = DeadlineScheduler(budget_s=1.0)
+    with scheduler.stage("sleep"):
+        time.sleep(0.6)
+    print(f"Tier after 1/4 pages: {scheduler.select_tier(1, 4)['name']}")
+    cell_scheduler = DeadlineScheduler(budget_s=1.0)
+    with cell_scheduler.stage("ocr"):
+        time.sleep(0.1)
+    cell_scheduler.cells_read = 1
+    print(f"Tier with 20 cells left: {cell_scheduler.select_tier_for_cells(20)['name']}")
+    print(scheduler.summary())
@@ -0,0 +1,192 @@
+import os
+import json
+import logging
+from collections import OrderedDict
+import numpy as np
+import cv2
+from PIL import Image, ImageDraw
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class StructureCache:
+    """
+    Reuses table structure (rows/columns/cells) across tables that share a layout,
+    e.g. recurring statement formats or continuation pages of a multi-page table.
+
+    Each table crop is fingerprinted by its ink and ruling-line profiles along both
+    axes, plus the number of text-line bands. When a cached template has the same
+    number of bands and matches closely enough, its geometry, stored in relative
+    coordinates, is rescaled to the new crop instead of running the structure
+    model; weaker matches fall back to the model.
+    """
+
+    BINS = 64
+    WORK_WIDTH = 512
+
+    def __init__(self, match_threshold=0.95, max_aspect_delta=0.15, max_entries=256, cache_path=None):
+        self.match_threshold = match_threshold
+        self.max_aspect_delta = max_aspect_delta
+        self.max_entries = max_entries
+        self.cache_path = cache_path
+        self.entries = OrderedDict()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        if cache_path and os.path.exists(cache_path):
+            self.load()
+
+    def _profile(self, values):
+        resampled = np.interp(np.linspace(0, len(values) - 1, self.BINS), np.arange(len(values)), values)
+        centered = resampled - resampled.mean()
+        norm = np.linalg.norm(centered)
+        return centered / norm if norm > 0 else np.zeros(self.BINS)
+
+    def fingerprint(self, table_img):
+        """Returns (profiles, log aspect ratio, text-line band count) for a table crop."""
+        gray = np.array(table_img.convert('L'))
+        h, w = gray.shape
+        if w > self.WORK_WIDTH:
+            gray = cv2.resize(gray, (self.WORK_WIDTH, max(1, int(h * self.WORK_WIDTH / w))), interpolation=cv2.INTER_AREA)
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        bh, bw = binary.shape
+
+        h_rules = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (max(1, bw // 4), 1)))
+        v_rules = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(1, bh // 4))))
+        ink = binary > 0
+        profiles = np.stack([
+            self._profile(ink.mean(axis=1)),
+            self._profile(ink.mean(axis=0)),
+            self._profile((h_rules > 0).mean(axis=1)),
+            self._profile((v_rules > 0).mean(axis=0)),
+        ])
+        # Text-line bands: rows with ink once horizontal and vertical ruling lines are removed
+        text_rows = np.concatenate(([False], (ink & (h_rules == 0) & (v_rules == 0)).any(axis=1)))
+        lines = int(np.count_nonzero(text_rows[1:] & ~text_rows[:-1]))
+        return profiles, float(np.log(w / h)), lines
+
+    def _similarity(self, a, b):
+        """
+        Mean correlation across the profiles present in either crop. Profiles empty in
+        both (no ruling lines, as in most borderless statements) carry no evidence and
+        are left out; the ink profiles must always be present.
+        """
+        scores = []
+        for idx, (pa, pb) in enumerate(zip(a, b)):
+            empty_a, empty_b = not pa.any(), not pb.any()
+            if empty_a and empty_b:
+                if idx < 2:
+                    return 0.0
+                continue
+            scores.append(0.0 if empty_a or empty_b else float(np.dot(pa, pb)))
+        return sum(scores) / len(scores)
+
+    def lookup(self, table_img):
+        """
+        Returns (structure, similarity) rescaled to table_img when a template matches,
+        or (None, best_similarity) when the structure model should be run.
+        """
+        if table_img.size[0] == 0 or table_img.size[1] == 0:
+            return None, 0.0
+        profiles, aspect, lines = self.fingerprint(table_img)
+
+        best_key, best_sim = None, 0.0
+        for key, entry in self.entries.items():
+            # Reused row geometry is only valid for the same number of rows
+            if entry.get('lines') != lines or abs(entry['aspect'] - aspect) > self.max_aspect_delta:
+                continue
+            sim = self._similarity(profiles, entry['profiles'])
+            if sim > best_sim:
+                best_key, best_sim = key, sim
+
+        if best_key is None or best_sim < self.match_threshold:
+            self.misses += 1
+            if best_key is not None:
+                logger.info(f"Weak structure template match ({best_sim:.3f}), falling back to structure model.")
+            return None, best_sim
+
+        self.hits += 1
+        self.entries.move_to_end(best_key)
+        w, h = table_img.size
+        structure = []
+        for item in self.entries[best_key]['structure']:
+            x0, y0, x1, y1 = item['box']
+            structure.append({
+                "box": [round(x0 * w, 2), round(y0 * h, 2), round(x1 * w, 2), round(y1 * h, 2)],
+                # Reused detections are only as trustworthy as the template match
+                "score": item['score'] * best_sim,
+                "label": item['label']
+            })
+        return structure, best_sim
+
+    def store(self, table_img, structure):
+        """Adds a template for the crop's layout; structures without rows or columns are not cached."""
+        labels = {s['label'] for s in structure}
+        if 'table row' not in labels or 'table column' not in labels:
+            return
+        profiles, aspect, lines = self.fingerprint(table_img)
+        w, h = table_img.size
+        relative = [{
+            "box": [s['box'][0] / w, s['box'][1] / h, s['box'][2] / w, s['box'][3] / h],
+            "score": s['score'],
+            "label": s['label']
+        } for s in structure]
+
+        self.entries[self._next_id] = {'profiles': profiles, 'aspect': aspect, 'lines': lines, 'structure': relative}
+        self._next_id += 1
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        serializable = {key: {
+            'profiles': entry['profiles'].tolist(),
+            'aspect': entry['aspect'],
+            'lines': entry['lines'],
+            'structure': entry['structure']
+        } for key, entry in self.entries.items()}
+        # Write then rename, so workers sharing the cache never read a half-written file
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(serializable, f)
+        os.replace(tmp_path, self.cache_path)
+        logger.info(f"Saved {len(self.entries)} structure templates to {self.cache_path}")
+
+    def load(self):
+        """Loads persisted templates; an unreadable cache is ignored and later overwritten."""
+        try:
+            with open(self.cache_path) as f:
+                stored = json.load(f)
+            entries = OrderedDict(
+                (int(key), {
+                    'profiles': np.array(entry['profiles']),
+                    'aspect': entry['aspect'],
+                    'lines': entry.get('lines'),
+                    'structure': entry['structure']
+                }) for key, entry in stored.items()
+            )
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable structure cache {self.cache_path}: {e}")
+            return
+        self.entries.update(entries)
+        self._next_id = max(self.entries, default=-1) + 1
+        logger.info(f"Loaded {len(self.entries)} structure templates from {self.cache_path}")
+
+
+if __name__ == "__main__":
+    cache = StructureCache()
+    table = Image.new('RGB', (600, 300), color='white')
+    draw = ImageDraw.Draw(table)
+    for top in range(20, 280, 60):
+        draw.rectangle([20, top, 200, top + 20], fill='black')
+        draw.rectangle([420, top, 560, top + 20], fill='black')
+    structure = [
+        {"box": [0, 0, 600, 100], "score": 0.9, "label": "table row"},
+        {"box": [0, 0, 300, 300], "score": 0.9, "label": "table column"},
+    ]
+    cache.store(table, structure)
+    reused, sim = cache.lookup(table.resize((900, 450)))
+    print(f"Template reuse: {reused is not None} (similarity {sim:.3f})")
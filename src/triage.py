@@ -0,0 +1,196 @@
+import logging
+import numpy as np
+import cv2
+from PIL import Image
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _runs(mask):
+    """Returns (start, end) index pairs for contiguous True runs in a 1-D boolean array."""
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+class PageTriage:
+    """
+    Scores how likely a page is to contain a table using cheap classical analysis,
+    so narrative-only pages can skip the Table Transformer detector.
+
+    The default threshold of 0 keeps every page; raise it only to a value backed by
+    a calibration run (see calibration_report), since borderless two-column tables
+    score low on both signals.
+
+    Two signals are computed on a downsampled, binarized page:
+    1. Ruling lines: long horizontal/vertical strokes isolated by morphological opening.
+    2. Whitespace grid: runs of consecutive text lines split into several
+       widely separated segments (borderless statement layouts).
+    """
+
+    def __init__(self, threshold=0.0, target_width=800, min_grid_lines=3, min_segments=3):
+        self.threshold = threshold
+        self.target_width = target_width
+        self.min_grid_lines = min_grid_lines
+        self.min_segments = min_segments
+        self.calibration = []
+
+    def _binarize(self, pil_image):
+        gray = np.array(pil_image.convert('L'))
+        h, w = gray.shape
+        if w > self.target_width:
+            scale = self.target_width / w
+            gray = cv2.resize(gray, (self.target_width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        return binary
+
+    def _line_score(self, binary):
+        h, w = binary.shape
+        h_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(1, w // 8), 1))
+        v_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(1, h // 30)))
+        h_lines = cv2.morphologyEx(binary, cv2.MORPH_OPEN, h_kernel)
+        v_lines = cv2.morphologyEx(binary, cv2.MORPH_OPEN, v_kernel)
+
+        n_h = len(_runs(h_lines.any(axis=1)))
+        n_v = len(_runs(v_lines.any(axis=0)))
+        # Financial statements often only rule the header and totals, so horizontal
+        # rules carry most of the weight and verticals only boost it.
+        return min(1.0, n_h / 4) * (0.5 + 0.5 * min(1.0, n_v / 2))
+
+    def _grid_score(self, binary):
+        h, w = binary.shape
+        # Column gutters are much wider than word gaps
+        gap_px = max(2, w // 40)
+        best_run, current_run = 0, 0
+        for top, bottom in _runs(binary.any(axis=1)):
+            occupied = binary[top:bottom].any(axis=0)
+            segments = 0
+            for start, end in _runs(~occupied):
+                if start == 0 or end == w:
+                    continue
+                if end - start >= gap_px:
+                    segments += 1
+            segments += 1 if occupied.any() else 0
+            if segments >= self.min_segments:
+                current_run += 1
+                best_run = max(best_run, current_run)
+            else:
+                current_run = 0
+        if best_run < self.min_grid_lines:
+            return 0.0
+        return min(1.0, best_run / (2 * self.min_grid_lines))
+
+    def score(self, pil_image):
+        """Returns a table likelihood in [0, 1] for the page."""
+        binary = self._binarize(pil_image)
+        if not binary.any():
+            return 0.0
+        return max(self._line_score(binary), self._grid_score(binary))
+
+    def should_skip(self, score):
+        return score < self.threshold
+
+    def reset_calibration(self):
+        self.calibration = []
+
+    def record(self, score, num_tables):
+        """Stores a (score, detector result) pair for calibration."""
+        self.calibration.append((score, num_tables))
+
+    def calibration_report(self):
+        """
+        Compares triage decisions against the detector's output on the recorded pages.
+        Recall is the fraction of pages with detected tables that triage would keep.
+        """
+        with_tables = [s for s, n in self.calibration if n > 0]
+        skipped = [s for s, n in self.calibration if self.should_skip(s)]
+        missed = [s for s in with_tables if self.should_skip(s)]
+        return {
+            "threshold": self.threshold,
+            "pages": len(self.calibration),
+            "pages_with_tables": len(with_tables),
+            "pages_skipped": len(skipped),
+            "tables_pages_missed": len(missed),
+            "recall": 1.0 - len(missed) / len(with_tables) if with_tables else 1.0,
+            "skip_rate": len(skipped) / len(self.calibration) if self.calibration else 0.0,
+            # Highest threshold that would still have kept every table page
+            "max_safe_threshold": min(with_tables) if with_tables else None
+        }
+
+
+class CellTriage:
+    """
+    Classifies a cell crop as 'blank', 'numeric' or 'text' from ink density and
+    connected-component statistics, so blank cells can skip OCR and numeric-like
+    cells can use a cheaper decoding configuration.
+
+    Numeric-like cells are short runs of glyphs of near-uniform height (digits have
+    no ascenders or descenders) and near-uniform width; lowercase text mixes x-height
+    and tall glyphs, and capitals vary in width.
+    """
+
+    LABELS = ('blank', 'numeric', 'text')
+
+    def __init__(self, min_contrast=40, blank_ink_ratio=0.005, max_numeric_glyphs=16, tall_fraction=0.8,
+                 narrow_aspect=0.4, max_digit_aspect=0.72, max_width_cv=0.1):
+        self.min_contrast = min_contrast
+        self.blank_ink_ratio = blank_ink_ratio
+        self.max_numeric_glyphs = max_numeric_glyphs
+        self.tall_fraction = tall_fraction
+        self.narrow_aspect = narrow_aspect
+        self.max_digit_aspect = max_digit_aspect
+        self.max_width_cv = max_width_cv
+
+    def _binarize(self, pil_image):
+        gray = np.array(pil_image.convert('L'))
+        if gray.size == 0 or int(gray.max()) - int(gray.min()) < self.min_contrast:
+            return None
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        # Drop ruling lines clipped into the crop at the cell borders
+        binary[(binary > 0).mean(axis=1) > 0.9, :] = 0
+        binary[:, (binary > 0).mean(axis=0) > 0.9] = 0
+        return binary
+
+    def classify(self, pil_image):
+        binary = self._binarize(pil_image)
+        if binary is None or (binary > 0).mean() < self.blank_ink_ratio:
+            return 'blank'
+
+        _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        stats = stats[1:][stats[1:, cv2.CC_STAT_AREA] >= 3]
+        if stats.shape[0] == 0:
+            return 'blank'
+        heights = stats[:, cv2.CC_STAT_HEIGHT]
+        widths = stats[:, cv2.CC_STAT_WIDTH]
+
+        # Ignore punctuation and signs (periods, commas, minus) when judging glyph heights
+        max_h = heights.max()
+        is_glyph = heights >= 0.35 * max_h
+        is_tall = heights >= 0.75 * max_h
+        if is_glyph.sum() > self.max_numeric_glyphs or is_tall.sum() < self.tall_fraction * is_glyph.sum():
+            return 'text'
+        if self._digit_shaped(widths[is_tall], heights[is_tall]):
+            return 'numeric'
+        return 'text'
+
+    def _digit_shaped(self, widths, heights):
+        """
+        Capitals pass the uniform-height test too ('TOTAL ASSETS'), so also require
+        digit proportions: figures are set on a fixed advance, so their widths barely
+        vary and none is as wide as M, W, O or a pair of touching capitals.
+        Narrow glyphs (1, parentheses) are left out of the comparison.
+        """
+        aspects = widths / heights
+        body = aspects >= self.narrow_aspect
+        if not body.any():
+            return True
+        body_widths = widths[body]
+        width_cv = body_widths.std() / body_widths.mean()
+        return aspects[body].max() <= self.max_digit_aspect and width_cv <= self.max_width_cv
+
+if __name__ == "__main__":
+    triage = PageTriage()
+    blank = Image.new('RGB', (1700, 2200), color='white')
+    print(f"Blank page score: {triage.score(blank):.3f}")
+    print(f"Blank cell class: {CellTriage().classify(Image.new('RGB', (100, 30), color='white'))}")
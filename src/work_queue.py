@@ -0,0 +1,305 @@
+import os
+import time
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_path TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    last_error TEXT,
+    table_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+"""
+
+
+class LeaseLost(Exception):
+    """The worker's lease on a job lapsed and the job may now belong to another worker."""
+
+
+class WorkQueue:
+    """
+    Durable job queue in a SQLite file with time-limited leases.
+
+    Workers claim the oldest queued job and must heartbeat before the lease expires.
+    A job whose lease lapses (worker crashed or lost) is requeued on the next claim,
+    up to max_attempts, after which it is dead-lettered. Workers need no registration,
+    so any number of processes can join or leave. For several hosts, place the database
+    on a shared filesystem with working POSIX locks (e.g. NFSv4 with locking enabled).
+    """
+
+    STATUSES = ('queued', 'leased', 'done', 'dead')
+
+    def __init__(self, db_path, lease_seconds=300, max_attempts=3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # Autocommit mode so claims can take the write lock explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        # Rollback journal rather than WAL: WAL's shared-memory index only works for
+        # processes on one host, and the queue is meant to be shared across hosts
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+
+    def enqueue(self, file_path, document_id=None):
+        document_id = document_id or os.path.basename(file_path)
+        cur = self.conn.execute(
+            "INSERT INTO jobs (file_path, document_id, enqueued_at) VALUES (?, ?, ?)",
+            (os.path.abspath(file_path), document_id, time.time())
+        )
+        return cur.lastrowid
+
+    def _expire_leases(self, now):
+        """Requeues lapsed leases, dead-lettering jobs that have used all their attempts."""
+        self.conn.execute(
+            "UPDATE jobs SET status = 'dead', lease_owner = NULL, finished_at = ?, "
+            "last_error = COALESCE(last_error, 'lease expired') "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, now, self.max_attempts)
+        )
+        self.conn.execute(
+            "UPDATE jobs SET status = 'queued', lease_owner = NULL, last_error = 'lease expired' "
+            "WHERE status = 'leased' AND lease_expires < ?",
+            (now,)
+        )
+
+    def claim(self, worker_id):
+        """Leases the oldest queued job to worker_id; returns it as a dict, or None if the queue is empty."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._expire_leases(now)
+            row = self.conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (worker_id, now + self.lease_seconds, now, row['id'])
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        job = dict(row)
+        job['attempts'] += 1
+        return job
+
+    def heartbeat(self, job_id, worker_id):
+        """Extends the lease; returns False if worker_id no longer holds it."""
+        cur = self.conn.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (time.time() + self.lease_seconds, job_id, worker_id)
+        )
+        return cur.rowcount == 1
+
+    def complete(self, job_id, worker_id, table_count=None):
+        cur = self.conn.execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, table_count = ?, last_error = NULL "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (time.time(), table_count, job_id, worker_id)
+        )
+        return cur.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Releases a failed job for retry, or dead-letters it once max_attempts is reached."""
+        cur = self.conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'queued' END, "
+            "lease_owner = NULL, lease_expires = NULL, last_error = ?, "
+            "finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (self.max_attempts, str(error), self.max_attempts, time.time(), job_id, worker_id)
+        )
+        return cur.rowcount == 1
+
+    def stats(self, window_s=3600):
+        """Queue depth by status and per-worker throughput over the last window_s seconds."""
+        counts = dict.fromkeys(self.STATUSES, 0)
+        for row in self.conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row['status']] = row['n']
+        since = time.time() - window_s
+        workers = {}
+        for row in self.conn.execute(
+            "SELECT lease_owner, COUNT(*) AS n, AVG(finished_at - started_at) AS avg_s "
+            "FROM jobs WHERE status = 'done' AND finished_at >= ? GROUP BY lease_owner",
+            (since,)
+        ):
+            workers[row['lease_owner']] = {
+                "completed": row['n'],
+                "docs_per_hour": row['n'] * 3600 / window_s,
+                "avg_seconds_per_doc": round(row['avg_s'] or 0.0, 3)
+            }
+        return {"depth": counts['queued'] + counts['leased'], "counts": counts, "workers": workers}
+
+    def dead_letters(self):
+        return [dict(row) for row in self.conn.execute(
+            "SELECT id, file_path, document_id, attempts, last_error FROM jobs WHERE status = 'dead' ORDER BY id"
+        )]
+
+
+class QueueWorker:
+    """Claims jobs from a WorkQueue and runs them through an OCRPipeline, heartbeating while busy."""
+
+    # Ceiling for the retry delay while the queue database stays locked
+    MAX_BACKOFF_S = 60.0
+
+    def __init__(self, pipeline, queue, worker_id=None, output_dir=None, evaluator=None):
+        self.pipeline = pipeline
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.output_dir = output_dir
+        self.evaluator = evaluator
+
+    def _settle(self, job, update, *args):
+        """
+        Runs queue.complete/fail for a job, retrying briefly while the database is locked.
+        If it never succeeds the lease simply expires and the job is retried elsewhere.
+        """
+        for attempt in range(3):
+            try:
+                return update(job['id'], self.worker_id, *args)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Job {job['id']}: {update.__name__} failed ({e}); attempt {attempt + 1}/3.")
+                time.sleep(2 ** attempt)
+        logger.error(f"Job {job['id']}: could not record its outcome; the lease will expire.")
+        return None
+
+    def _heartbeat_loop(self, job_id, stop, lease_lost):
+        # SQLite connections are per-thread, so the heartbeat opens its own
+        queue = None
+        interval = self.queue.lease_seconds / 3
+        while not stop.wait(interval):
+            try:
+                if queue is None:
+                    queue = WorkQueue(self.queue.db_path, self.queue.lease_seconds, self.queue.max_attempts)
+                renewed = queue.heartbeat(job_id, self.worker_id)
+            except sqlite3.Error as e:
+                # Database locked or unreachable: a missed heartbeat, the lease may still be ours
+                logger.warning(f"Job {job_id}: heartbeat failed ({e}); retrying.")
+                continue
+            if not renewed:
+                logger.warning(f"Job {job_id}: lease lost by {self.worker_id}.")
+                lease_lost.set()
+                break
+
+    def process(self, job, lease_lost=None):
+        """
+        Extracts and exports one job. Raises LeaseLost, before writing any output, if the
+        lease lapsed while extracting; outputs are named per job so two documents with
+        the same file name never overwrite each other.
+        """
+        stem = os.path.splitext(os.path.basename(job['document_id']))[0]
+        base_name = f"{stem}_job{job['id']}"
+        results = self.pipeline.process_document(job['file_path'])
+        # Renew the lease as a final check, in case it lapsed since the last heartbeat
+        try:
+            renewed = self.queue.heartbeat(job['id'], self.worker_id)
+        except sqlite3.OperationalError as e:
+            raise LeaseLost(f"Job {job['id']}: cannot confirm lease before export ({e})")
+        if not renewed or (lease_lost is not None and lease_lost.is_set()):
+            raise LeaseLost(f"Job {job['id']}: lease lost before export")
+        self.pipeline.export(results, base_name, output_dir=self.output_dir, document_id=job['document_id'])
+        if self.evaluator is not None:
+            self.evaluator.record_document(job['document_id'], results, stage_times=self.pipeline.stage_times)
+        return len(results)
+
+    def run(self, poll_interval=5.0, max_jobs=None, exit_when_empty=False):
+        """Processes jobs until max_jobs is reached, or the queue drains when exit_when_empty is set."""
+        processed = 0
+        backoff = poll_interval
+        logger.info(f"Worker {self.worker_id} started.")
+        while max_jobs is None or processed < max_jobs:
+            try:
+                job = self.queue.claim(self.worker_id)
+            except sqlite3.OperationalError as e:
+                # Lock contention on a shared database outlasted the busy timeout; back off and retry
+                logger.warning(f"Worker {self.worker_id}: claim failed ({e}); retrying in {backoff:.1f}s.")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.MAX_BACKOFF_S)
+                continue
+            backoff = poll_interval
+            if job is None:
+                if exit_when_empty:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            logger.info(f"Job {job['id']}: {job['document_id']} (attempt {job['attempts']}/{self.queue.max_attempts})")
+            stop, lease_lost = threading.Event(), threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat_loop, args=(job['id'], stop, lease_lost), daemon=True)
+            heartbeat.start()
+            try:
+                table_count = self.process(job, lease_lost)
+            except LeaseLost as e:
+                # The job has been requeued or claimed elsewhere; abandon it without touching its state
+                logger.warning(f"{e}; abandoning it.")
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {e}")
+                self._settle(job, self.queue.fail, e)
+            else:
+                if self._settle(job, self.queue.complete, table_count) is False:
+                    logger.warning(f"Job {job['id']}: lease expired before completion; it will be retried elsewhere.")
+            finally:
+                stop.set()
+                heartbeat.join()
+            processed += 1
+        logger.info(f"Worker {self.worker_id} stopping after {processed} jobs.")
+        return processed
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Durable work queue for multi-node extraction.")
+    parser.add_argument("--db", default=os.getenv("WORK_QUEUE_DB") or os.path.join(base_dir, "data", "queue", "jobs.db"))
+    parser.add_argument("--lease-seconds", type=float, default=300)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    sub = parser.add_subparsers(dest="command", required=True)
+    enqueue_cmd = sub.add_parser("enqueue", help="Add documents to the queue")
+    enqueue_cmd.add_argument("files", nargs="+")
+    worker_cmd = sub.add_parser("worker", help="Claim and process jobs")
+    worker_cmd.add_argument("--max-jobs", type=int)
+    worker_cmd.add_argument("--exit-when-empty", action="store_true")
+    worker_cmd.add_argument("--output-dir")
+    sub.add_parser("stats", help="Show queue depth and per-worker throughput")
+    sub.add_parser("dead", help="List dead-lettered jobs")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.db, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+    if args.command == "enqueue":
+        for path in args.files:
+            print(f"Enqueued job {queue.enqueue(path)}: {path}")
+    elif args.command == "stats":
+        print(queue.stats())
+    elif args.command == "dead":
+        for job in queue.dead_letters():
+            print(job)
+    else:
+        try:
+            from src.pipeline import OCRPipeline
+            from src.evaluator import PerformanceEvaluator
+        except ImportError:
+            from pipeline import OCRPipeline
+            from evaluator import PerformanceEvaluator
+        metrics_db = os.getenv("METRICS_DB") or None
+        evaluator = PerformanceEvaluator(store_path=metrics_db) if metrics_db else None
+        pipeline = OCRPipeline(structure_cache_path=os.getenv("STRUCTURE_CACHE") or None)
+        worker = QueueWorker(pipeline, queue, output_dir=args.output_dir, evaluator=evaluator)
+        worker.run(max_jobs=args.max_jobs, exit_when_empty=args.exit_when_empty)